@@ -1,35 +1,119 @@
 # csv_reader.py
 from __future__ import annotations
-import csv, io, requests
-from typing import List, Dict, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List
 
-def fetch_csv(url: str) -> Tuple[List[str], List[Dict[str, str]]]:
+import polars as pl
+
+# One keep-alive session per process: repeated fetches (e.g. a scheduled
+# re-import) reuse the TCP/TLS connection, and transient errors are retried.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.3))
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+# End-of-record marker for feeds with overflowing rows: appended to every line
+# as one more ';' field, so the column it lands in is the record's real field
+# count. Polars can't report that itself (short rows are padded, so a missing
+# field and an empty one look the same). Inside quoted fields it is plain text
+# and is stripped again.
+_END = "\x00"
+_END_FIELD = ";" + _END
+
+# Spare columns read past the header on the first attempt; doubled until the
+# widest record fits, so no overflow segment is ever dropped.
+OVERFLOW_COLUMNS = 8
+
+
+def _read(data: bytes, columns: List[str], **kwargs) -> pl.DataFrame:
+    return pl.read_csv(
+        data,
+        separator=';',
+        quote_char='"',
+        has_header=False,
+        schema={c: pl.String for c in columns},
+        missing_columns="insert",
+        empty_string_is_null=False,  # short rows are padded with '' as well
+        encoding="utf8-lossy",
+        raise_if_empty=False,
+        **kwargs,
+    )
+
+
+def fetch_csv(url: str) -> pl.DataFrame:
     """
-Downloads the CSV and returns header + row data as dictionaries.
+Downloads the CSV and returns it as an all-string Polars DataFrame
+named after the feed's own header row.
 
-- Uses ';' as delimiter and '"' as quote character  
-- Supports newlines inside quoted fields (e.g. long HTML descriptions)  
-- If a row has more fields than expected, extra values are merged into the last column  
+- Uses ';' as delimiter and '"' as quote character
+- Supports newlines inside quoted fields (e.g. long HTML descriptions)
+- If a row has more fields than expected, extra values are merged into the last column
   (this usually happens in the description field where HTML or text can contain commas/semicolons)
+- Empty and missing fields are '' (never null), like the csv-module reader did
+- Parsing is done by Polars' native CSV reader (no per-character Python work),
+  including the overflow merge, see _read_overflowing()
 """
 
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    text = r.content.decode("utf-8", errors="replace")
-    buf = io.StringIO(text)
-
-    # header
-    header_line = buf.readline().rstrip("\n")
-    headers = next(csv.reader([header_line], delimiter=';', quotechar='"'))
-    expected = len(headers)
-
-    rows: List[Dict[str, str]] = []
-    reader = csv.reader(buf, delimiter=';', quotechar='"')
-    for row in reader:
-        if len(row) > expected:
-            row = row[: expected - 1] + [';'.join(row[expected - 1:])]
-        elif len(row) < expected:
-            row = row + [''] * (expected - len(row))
-        item = {headers[i]: row[i] for i in range(expected)}  
-        rows.append(item)
-    return headers, rows
+    with _SESSION.get(url, timeout=30) as r:
+        r.raise_for_status()
+        body = r.content
+
+    # header: parsed from the raw bytes by Polars as well, no Python-side decode
+    header_line, _, data = body.partition(b"\n")
+    headers = pl.read_csv(
+        header_line, separator=';', quote_char='"', n_rows=0, encoding="utf8-lossy"
+    ).columns
+    columns = [f"column_{i}" for i in range(len(headers))]
+    if data and not data.endswith(b"\n"):
+        data += b"\n"  # else Polars drops a trailing empty field of the last line
+
+    try:
+        df = _read(data, columns)
+    except (pl.exceptions.SchemaError, pl.exceptions.ComputeError):
+        # some row has more fields than the header (SchemaError if it is the
+        # first one, ComputeError otherwise)
+        df = _read_overflowing(data, columns)
+    return df.rename(dict(zip(columns, headers)))
+
+
+def _read_overflowing(data: bytes, columns: List[str]) -> pl.DataFrame:
+    """
+Parses a feed whose rows may carry extra ';' fields and joins every field
+past the second-to-last column back into the last one, keeping empty
+segments ("a;;b" stays "a;;b"), still in one Polars pass.
+"""
+    end = _END_FIELD.encode()
+    data = data.replace(b"\n", end + b"\n").replace(b"\r" + end, end + b"\r")
+
+    expected = len(columns)
+    extra = OVERFLOW_COLUMNS
+    while True:
+        wide = [f"column_{i}" for i in range(expected + extra + 1)]
+        # records wider than this are cut, which shows as a missing marker
+        df = _read(data, wide, extra_columns="ignore", truncate_ragged_lines=True)
+        # fields per record = index of the column holding the marker
+        df = df.with_columns(
+            pl.coalesce([pl.when(pl.col(c) == _END).then(i) for i, c in enumerate(wide)]).alias("_fields")
+        )
+        if not df["_fields"].has_nulls():
+            break
+        extra *= 2
+
+    widest = df["_fields"].max() or 0
+    fields = pl.col("_fields")
+
+    def field(i: int) -> pl.Expr:
+        return pl.when(fields > i).then(pl.col(wide[i]))
+
+    last = expected - 1
+    df = df.select(
+        *(field(i).fill_null("").alias(columns[i]) for i in range(last)),
+        pl.concat_str([field(i) for i in range(last, max(widest, expected))], separator=';', ignore_nulls=True)
+        .fill_null("")
+        .alias(columns[last]),
+    )
+    # the marker is also appended inside quoted fields that span lines
+    marked = [c for c in columns if df[c].str.contains(_END_FIELD, literal=True).any()]
+    return df.with_columns(pl.col(marked).str.replace_all(_END_FIELD, "", literal=True))
@@ -1,11 +1,44 @@
 # database_handler.py
 from __future__ import annotations
-from typing import Iterable, Tuple, Optional
+from typing import Any, Iterable, Tuple
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
 
-from models import Base, ProductORM, IssueORM, ProductModel
+from models import Base, ProductORM, IssueORM
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    """
+    Bulk-load friendly SQLite settings, applied to every new connection:
+    WAL journal + synchronous=NORMAL means one fsync per commit instead of
+    per write, and temp data / page cache are kept in memory.
+    """
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-200000")  # ~200 MB
+    cur.close()
+
+
+# The feed import is a one-shot load written in a single transaction, so for
+# its duration we skip fsyncs and restore synchronous=NORMAL afterwards. The
+# journal stays in WAL: leaving WAL needs the only open connection to the file,
+# so any other reader (e.g. marketing_ai) would make the load fail as locked.
+_LOAD_PRAGMAS = (
+    "synchronous=OFF",
+)
+_RESTORE_PRAGMAS = (
+    "synchronous=NORMAL",
+)
+
+
+def _run_pragmas(conn, pragmas: Iterable[str]) -> None:
+    for pragma in pragmas:
+        conn.exec_driver_sql(f"PRAGMA {pragma}").close()
+    conn.commit()
 
 
 class Database:
@@ -17,43 +50,75 @@ class Database:
         variables or Secrets/ConfigMaps — not hardcoded inside the service.
         """
         self.engine = create_engine(f"sqlite:///{db_path}", future=True)
+        event.listen(self.engine, "connect", _set_sqlite_pragmas)
         Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(self.engine, future=True)
 
     def save(
         self,
-        products: Iterable[Tuple[ProductModel, Optional[str]]],
+        products: Iterable[Tuple[Any, ...]],
         issues: Iterable[Tuple[str, str]]
     ):
         """
         Saves validated products and any detected issues to the database.
 
-        - Uses SQLAlchemy `merge` → id-based UPSERT behavior
+        - `products` are positional rows in ProductORM column order
+          (already normalized, incl. the optional improved title) —
+          they are bound as they are, no per-row dicts
+        - Uses one `INSERT ... ON CONFLICT` statement per table, executed with
+          all rows as executemany parameters → id-based UPSERT behavior
+          (instead of a SELECT + INSERT/UPDATE round-trip per row via `merge`)
+        - Drops secondary indexes for the load and rebuilds them afterwards
+        - Runs the load with synchronous=OFF (no fsync) and restores
+          synchronous=NORMAL afterwards, even if the load fails
         - Ensures missing product IDs are handled safely
         - Commits once for efficiency
         """
-        with self.Session() as s:
-            # Store products (validated + optional improved title)
-            for p, improved in products:
-                s.merge(
-                    ProductORM(
-                        id=(p.id or ""),  # fallback to empty string if id missing
-                        title=p.title,
-                        improved_title=improved,
-                        description=p.description,
-                        price=p.price,
-                        currency=p.currency,
-                        gtin=p.gtin,
-                        brand=p.brand,
-                        image_url=str(p.image_url) if p.image_url else None,
-                        product_url=str(p.product_url) if p.product_url else None,
-                        category=p.category,
-                        availability=p.availability,
-                    )
-                )
-
-            # Store validation issues per product
-            for pid, iss in issues:
-                s.merge(IssueORM(id=(pid or ""), issue=iss))
-
-            s.commit()
+        # Store products (validated + optional improved title);
+        # id is the first column, fallback to empty string if missing
+        product_rows = [row if row[0] else ("",) + tuple(row[1:]) for row in products]
+
+        # Store validation issues per product
+        issue_rows = [(pid or "", iss) for pid, iss in issues]
+
+        # Secondary indexes are cheaper to rebuild once after the load
+        # than to maintain row by row during it (the PK stays in place)
+        secondary = list(ProductORM.__table__.indexes)
+
+        with self.engine.connect() as conn:
+            try:
+                _run_pragmas(conn, _LOAD_PRAGMAS)
+                for ix in secondary:
+                    ix.drop(conn, checkfirst=True)
+                conn.commit()
+                self._load(conn, product_rows, issue_rows)
+            finally:
+                # Also runs if the load failed, so the indexes never stay dropped
+                # and the pooled connection never keeps the load pragmas
+                try:
+                    for ix in secondary:
+                        ix.create(conn, checkfirst=True)
+                    conn.commit()
+                finally:
+                    _run_pragmas(conn, _RESTORE_PRAGMAS)
+
+    def _load(self, conn, product_rows, issue_rows) -> None:
+        """Write all rows in one transaction on `conn` (see `save`)."""
+        # Compiled once and run via the driver's executemany, so statement
+        # size does not grow with the number of rows. The tuples are bound
+        # positionally: the compiled VALUES (?, ...) list every column in
+        # table order, the same order the rows come in.
+        if product_rows:
+            stmt = sqlite_insert(ProductORM.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["id"],
+                set_={c.name: c for c in stmt.excluded if c.name != "id"},
+            )
+            conn.exec_driver_sql(str(stmt.compile(dialect=conn.dialect)), product_rows)
+
+        if issue_rows:
+            # (id, issue) is the whole row, so an existing match needs no update
+            stmt = sqlite_insert(IssueORM.__table__).on_conflict_do_nothing()
+            conn.exec_driver_sql(str(stmt.compile(dialect=conn.dialect)), issue_rows)
+
+        conn.commit()
@@ -1,16 +1,36 @@
 # main.py
 from __future__ import annotations
-import re, textwrap
-from typing import List, Dict, Optional, Tuple
+import re, sys, textwrap
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import polars as pl
 
 from csv_reader import fetch_csv
-from models import ProductModel, validate_product
+from models import ProductModel, ProductORM, find_issues, normalize_products
 from database_handler import Database
 
 FEED_URL = "https://hefitness.se/csv/"
 DB_PATH = "products.db"
 
+# Route title improvement through build_title_prompt + an LLM call
+USE_LLM_FOR_TITLES = False
+
+# Titles shorter than this (after stripping) are considered weak
+WEAK_TITLE_MIN_LEN = 12
+
+# Fixed values written on every row, defined once as interned constants
+CURRENCY = sys.intern("SEK")
+IN_STOCK = sys.intern("in_stock")
+OUT_OF_STOCK = sys.intern("out_of_stock")
+UNKNOWN_AVAILABILITY = sys.intern("unknown")
+
+_WS_RE = re.compile(r"\s+")
+_BRAND_RE = re.compile(r"Brand:\s*(.*)")
+_BASE_RE = re.compile(r'Current title:\s*"(.*)"')
+_NORM_RE = re.compile(r"\W+")
+
 
 # ---- AI mock logic ----
 def build_title_prompt(p: ProductModel) -> str:
@@ -26,36 +46,121 @@ def build_title_prompt(p: ProductModel) -> str:
     Category: {(p.category or "").strip() or "N/A"}
     """)
 
-def fake_ai_call(prompt: str) -> str:
+def format_title(brand: str, base: str) -> str:
     """
-    Simple heuristic to simulate AI output.
-    Extracts product brand/title and formats a cleaner version.
+    Shared title heuristic: "<Brand> <Title>", whitespace-collapsed,
+    Title Cased and capped at 70 chars.
     """
-    import re as _re
-    brand_m = _re.search(r"Brand:\s*(.*)", prompt)
-    base_m = _re.search(r'Current title:\s*"(.*)"', prompt)
-    brand = (brand_m.group(1).strip() if brand_m else "")
-    base = (base_m.group(1).strip() if base_m else "")
     parts = []
     if brand and brand.lower() != "n/a":
         parts.append(brand.strip())
     if base:
         parts.append(base)
     new_title = " ".join(parts) if parts else (brand or base or "Product")
-    new_title = _re.sub(r"\s+", " ", new_title).strip().title()
+    new_title = _WS_RE.sub(" ", new_title).strip().title()
     return (new_title[:67] + "…") if len(new_title) > 70 else new_title
 
+def fake_ai_call(prompt: str) -> str:
+    """
+    Simple heuristic to simulate AI output.
+    Extracts product brand/title and formats a cleaner version.
+    """
+    brand_m = _BRAND_RE.search(prompt)
+    base_m = _BASE_RE.search(prompt)
+    brand = (brand_m.group(1).strip() if brand_m else "")
+    base = (base_m.group(1).strip() if base_m else "")
+    return format_title(brand, base)
+
+def ai_call_batch(prompts: List[str]) -> List[str]:
+    """
+    Send several prompts in one round-trip and return answers in the same order.
+    A real LLM client would issue a single batched request here; the mock
+    simply answers each prompt locally.
+    """
+    return [fake_ai_call(prompt) for prompt in prompts]
+
+
+@dataclass(frozen=True)
+class BatchConfig:
+    """
+    Limits for TitleBatcher: send a batch when this many prompts are queued
+    (the rest goes out on `flush()`); at most `max_workers` batches in flight.
+    """
+    max_batch_size: int = 32
+    max_workers: int = 4
+
+
+class TitleBatcher:
+    """
+    DataLoader-style collector for title prompts.
+    Prompts are queued with the row index they belong to and sent through
+    `ai_call_batch` in groups, so a real LLM sees one request per batch
+    instead of one per product. Full batches are sent from a small thread
+    pool (LLM calls are I/O-bound), so collecting the next batch overlaps
+    with waiting on the previous ones. Results are returned keyed by row index.
+    """
+
+    def __init__(self, config: BatchConfig = BatchConfig(), call=ai_call_batch):
+        self.config = config
+        self.call = call
+        self.results: Dict[int, str] = {}
+        self._idx: List[int] = []
+        self._prompts: List[str] = []
+        self._pool = ThreadPoolExecutor(max_workers=config.max_workers)
+        self._in_flight: List[Tuple[List[int], Future]] = []
+
+    def __enter__(self) -> TitleBatcher:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._pool.shutdown(wait=True)
+
+    def add(self, idx: int, prompt: str) -> None:
+        """Queue a prompt; sends the batch once it is full."""
+        self._idx.append(idx)
+        self._prompts.append(prompt)
+        if len(self._prompts) >= self.config.max_batch_size:
+            self._send()
+
+    def _send(self) -> None:
+        if self._prompts:
+            self._in_flight.append((self._idx, self._pool.submit(self.call, self._prompts)))
+            self._idx, self._prompts = [], []
+
+    def flush(self) -> Dict[int, str]:
+        """Send whatever is queued, wait for all batches and return the results collected so far."""
+        self._send()
+        for idx, fut in self._in_flight:
+            for i, out in zip(idx, fut.result()):
+                self.results[i] = out
+        self._in_flight = []
+        return self.results
+
+
+def needs_title_improvement(p: ProductModel) -> bool:
+    """Titles that are missing or too short/weak get an AI rewrite."""
+    return not p.title or len(p.title.strip()) < WEAK_TITLE_MIN_LEN
+
 def improve_title_if_needed(p: ProductModel) -> Optional[str]:
-    """Return an improved title only if existing one is too short/weak."""
-    if not p.title or len(p.title.strip()) < 12:
-        return fake_ai_call(build_title_prompt(p))
+    """
+    Return an improved title only if existing one is too short/weak.
+
+    The mock AI only needs brand + title, so by default we format them
+    directly instead of rendering a prompt and regex-parsing it back.
+    Set USE_LLM_FOR_TITLES to go through the prompt path (real LLM wiring).
+    """
+    if needs_title_improvement(p):
+        if USE_LLM_FOR_TITLES:
+            return fake_ai_call(build_title_prompt(p))
+        return format_title((p.brand or "").strip() or "N/A", p.title.strip() if p.title else "")
     return None
 
 
 # ---- Header normalization helpers ----
+@lru_cache(maxsize=256)
 def normalize_key(s: str) -> str:
     """Convert feed column names to snake_case style keys."""
-    return re.sub(r"\W+", "_", s).lower()
+    return _NORM_RE.sub("_", s).lower()
 
 # Mapping feed headers → our canonical internal field names
 RENAME_MAP = {
@@ -74,24 +179,14 @@ RENAME_MAP = {
     "beskrivning": "description",
 }
 
-def normalize_rows(headers: List[str], rows: List[Dict[str, str]]) -> List[Dict[str, str]]:
+def normalize_headers(headers: List[str]) -> List[str]:
     """
-    Normalize feed rows:
+    Normalize feed header names:
     - Convert keys to snake_case
     - Apply friendly field renaming via RENAME_MAP
     """
-    norm = []
-    norm_headers = [normalize_key(h) for h in headers]
-    for row in rows:
-        r = {}
-        # using range() because we want raw index positions
-        for i in range(len(headers)):
-            key = norm_headers[i]
-            val = row[headers[i]]
-            r[key] = val
-        r = {RENAME_MAP.get(k, k): v for k, v in r.items()}
-        norm.append(r)
-    return norm
+    keys = [normalize_key(h) for h in headers]
+    return [RENAME_MAP.get(k, k) for k in keys]
 
 
 # ---- Explicit DataFrame schema ----
@@ -111,80 +206,96 @@ DF_SCHEMA = pl.Schema({
     "description": pl.String,
 })
 
-def to_dataframe(records: List[Dict[str, str]]) -> pl.DataFrame:
+def to_dataframe(raw: pl.DataFrame) -> pl.DataFrame:
     """
-    Convert raw dict records into a typed Polars DataFrame.
+    Convert the raw (all-string) feed frame into a typed Polars DataFrame.
     Includes safe casting for numeric fields and derived flags.
     """
-    df = pl.DataFrame(records, schema_overrides=DF_SCHEMA, strict=False)
+    df = raw
 
-    # Handle price safely whether it's string or already numeric
-    if "price" in df.columns:
-        if df["price"].dtype == pl.Utf8:
-            df = df.with_columns(
-                pl.col("price").str.replace(",", ".").cast(pl.Float64, strict=False)
-            )
-        else:
-            df = df.with_columns(pl.col("price").cast(pl.Float64, strict=False))
+    # Feed prices use a decimal comma ("199,99")
+    if "price" in df.columns and df["price"].dtype == pl.Utf8:
+        df = df.with_columns(pl.col("price").str.replace(",", "."))
 
-    # Ensure stock is integer
-    if "stock" in df.columns:
-        if df["stock"].dtype != pl.Int64:
-            df = df.with_columns(pl.col("stock").cast(pl.Int64, strict=False))
+    # Apply the explicit schema; unparsable numbers become null
+    df = df.cast({c: t for c, t in DF_SCHEMA.items() if c in df.columns}, strict=False)
 
     # Derived availability field
     if "stock" in df.columns:
         df = df.with_columns(
             pl.when(pl.col("stock") > 0)
-            .then(pl.lit("in_stock"))
-            .otherwise(pl.lit("out_of_stock"))
+            .then(pl.lit(IN_STOCK))
+            .otherwise(pl.lit(OUT_OF_STOCK))
             .alias("availability")
         )
     else:
-        df = df.with_columns(pl.lit("unknown").alias("availability"))
+        df = df.with_columns(pl.lit(UNKNOWN_AVAILABILITY).alias("availability"))
+
+    # Columns the feed doesn't carry are added as typed nulls, so the
+    # column-wise steps and the insert can rely on the full schema
+    df = df.with_columns(
+        pl.lit(None, dtype=t).alias(c) for c, t in DF_SCHEMA.items() if c not in df.columns
+    )
 
     # Add currency default
-    df = df.with_columns(pl.lit("SEK").alias("currency"))
+    df = df.with_columns(pl.lit(CURRENCY).alias("currency"))
     return df
 
 
 # ---- Main ETL flow ----
 def main():
     print("Downloading & reading feed…")
-    headers, rows = fetch_csv(FEED_URL)
+    raw = fetch_csv(FEED_URL)
 
-    # Normalize header names & row keys
-    records = normalize_rows(headers, rows)
+    # Normalize header names once for the whole frame
+    raw = raw.rename(dict(zip(raw.columns, normalize_headers(raw.columns))))
 
     # Create typed Polars DataFrame
-    df = to_dataframe(records)
+    df = to_dataframe(raw)
 
     print("Columns:", df.columns)
     print("Rows:", df.height)
     print(df.head(3))
 
-    total = flagged = improved_count = 0
-    example_improved = None
-
-    products_for_db: List[Tuple[ProductModel, Optional[str]]] = []
-    issues_for_db: List[Tuple[str, str]] = []
+    # Apply ProductModel's normalization column-wise (no per-row Pydantic objects)
+    df = normalize_products(df)
 
-    # Validate + optionally "AI-improve" titles
-    for row in df.iter_rows(named=True):
-        total += 1
-        p = ProductModel(**row)
+    # Business validation runs column-wise over the whole feed
+    issues_for_db: List[Tuple[str, str]] = find_issues(df).rows()
+    flagged = len(issues_for_db)
 
-        improved = improve_title_if_needed(p)
-        if improved:
-            improved_count += 1
-            if example_improved is None:
-                example_improved = improved
+    # Optionally "AI-improve" titles — only weak titles leave the columnar path
+    improved: List[Optional[str]] = [None] * df.height
+    weak = (
+        df.with_row_index("_row")
+        .filter(
+            pl.col("title").is_null()
+            | (pl.col("title").str.strip_chars().str.len_chars() < WEAK_TITLE_MIN_LEN)
+        )
+        .select("_row", "title", "brand", "category")
+    )
+    weak_products = (
+        (i, ProductModel.model_construct(title=title, brand=brand, category=category))
+        for i, title, brand, category in weak.iter_rows()
+    )
+    if USE_LLM_FOR_TITLES:
+        # The batcher's thread pool is only needed when prompts go to an LLM
+        with TitleBatcher(BatchConfig()) as batcher:
+            for i, p in weak_products:
+                batcher.add(i, build_title_prompt(p))
+            for i, title in batcher.flush().items():
+                improved[i] = title
+    else:
+        for i, p in weak_products:
+            improved[i] = improve_title_if_needed(p)
 
-        for iss in validate_product(p):
-            flagged += 1
-            issues_for_db.append((p.id or "", iss))
+    total = df.height
+    improved_count = sum(1 for t in improved if t)
+    example_improved = next((t for t in improved if t), None)
 
-        products_for_db.append((p, improved))
+    # Rows are only materialized here, at the insert boundary
+    df = df.with_columns(pl.Series("improved_title", improved, dtype=pl.String))
+    products_for_db = df.select(c.name for c in ProductORM.__table__.columns).rows()
 
     #  In production: DB path should come from env/secret, not hardcoded
     db = Database(DB_PATH)
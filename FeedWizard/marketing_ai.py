@@ -1,13 +1,40 @@
 # marketing_ai.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import os
+import re
 import sqlite3
 import textwrap
-from typing import Dict, List, Tuple, Optional
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 
 
 DB_PATH = "products.db"
 
+# Max LLM requests in flight at once (keep under the provider's rate limit)
+LLM_CONCURRENCY = 8
+
+# Products per request for the batched prompts (rules are sent once per batch)
+LLM_BATCH_SIZE = 10
+
+# Response cache: in-process LRU in front of a table in the products DB
+LLM_CACHE_SIZE = 4096
+LLM_CACHE_TABLE = "llm_cache"
+LLM_CACHE_TTL_S = 7 * 24 * 3600  # stored answers older than this are refreshed
+
+# Rendered prompts kept per builder (bounded: most keys are unique per product)
+PROMPT_CACHE_SIZE = 1024
+
+_WS_RE = re.compile(r"\s+")
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
 
 # ---------- Mock AI + Prompt Templates ----------
 def mock_llm(prompt: str) -> str:
@@ -23,6 +50,60 @@ def mock_llm(prompt: str) -> str:
     return f"[MOCK_AI_OUT] {base} ..."
 
 
+# ---------- Response cache ----------
+# Runners often rebuild the same prompt (same title/brand/category, or the
+# same category list for the blog outline), so answers are memoized by a
+# SHA256 of the whitespace-normalized prompt. Hits skip the LLM entirely.
+# Only real model answers are cached; the free mock is never stored.
+_L0: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _cache_key(backend: str, prompt: str) -> str:
+    canon = _WS_RE.sub(" ", prompt).strip()
+    return hashlib.sha256(f"{backend}\0{canon}".encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def _cache_db() -> sqlite3.Connection:
+    con = _db()
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {LLM_CACHE_TABLE} ("
+        "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    return con
+
+
+def _cache_get(key: str) -> Optional[str]:
+    if key in _L0:
+        _L0.move_to_end(key)
+        return _L0[key]
+    row = _cache_db().execute(
+        f"SELECT response FROM {LLM_CACHE_TABLE} WHERE key = ? AND created_at >= ?",
+        (key, time.time() - LLM_CACHE_TTL_S),
+    ).fetchone()
+    if row is not None:
+        _l0_put(key, row[0])
+        return row[0]
+    return None
+
+
+def _cache_put(key: str, response: str) -> None:
+    _l0_put(key, response)
+    con = _cache_db()
+    con.execute(
+        f"INSERT OR REPLACE INTO {LLM_CACHE_TABLE} (key, response, created_at) VALUES (?, ?, ?)",
+        (key, response, time.time()),
+    )
+    con.commit()
+
+
+def _l0_put(key: str, response: str) -> None:
+    _L0[key] = response
+    _L0.move_to_end(key)
+    if len(_L0) > LLM_CACHE_SIZE:
+        _L0.popitem(last=False)
+
+
 def llm_call_pseudocode(provider: str, prompt: str) -> str:
     """
     Pseudocode showing how real LLM calls would be integrated.
@@ -42,27 +123,130 @@ def llm_call_pseudocode(provider: str, prompt: str) -> str:
         return res.choices[0].message.content
 
     This function still returns mock output for this demo.
+    The runners use the async `llm_call_async` below.
     """
     return mock_llm(prompt)
 
 
+# One semaphore per event loop, shared by every llm_call_async (single calls,
+# fan-outs and batches, across concurrently running sections)
+_LLM_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _LLM_SEMAPHORES.get(loop)
+    if sem is None:
+        sem = _LLM_SEMAPHORES[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return sem
+
+
+@lru_cache(maxsize=1)
+def _async_openai_client():
+    from openai import AsyncOpenAI  # optional dependency, only needed with an API key
+    return AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+
+
+async def llm_call_async(
+    provider: str,
+    prompt: str,
+    system: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    max_tokens: int = 150,
+    json_mode: bool = False,
+    accept: Optional[Callable[[str], bool]] = None,
+) -> str:
+    """
+    Non-blocking LLM call so many prompts can wait on the network at once.
+
+    Goes to OpenAI via `AsyncOpenAI` when OPENAI_API_KEY is set and the
+    `openai` package is installed; otherwise falls back to `mock_llm`.
+    If `prompt` starts with the static `system` block, that block is sent as
+    the system message and only the remainder as the user message;
+    `cache_key` is passed as OpenAI's `prompt_cache_key` routing hint, and
+    `json_mode` asks for a JSON object via `response_format`.
+    Model answers are memoized (see "Response cache" above), but only
+    complete ones (finish_reason "stop") that `accept` approves, if given;
+    anything else is returned as usual and requested again next time.
+    """
+    if provider != "openai" or not os.environ.get("OPENAI_API_KEY"):
+        return llm_call_pseudocode(provider, prompt)
+    try:
+        client = _async_openai_client()
+    except ImportError:
+        return llm_call_pseudocode(provider, prompt)
+
+    key = _cache_key("openai:gpt-4o-mini", prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    if system and prompt.startswith(system):
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt[len(system):].strip()},
+        ]
+    else:
+        messages = [
+            {"role": "system", "content": "You are a marketing copywriter."},
+            {"role": "user", "content": prompt},
+        ]
+    # Optional parameters are only sent when used
+    extra = {}
+    if json_mode:
+        extra["response_format"] = {"type": "json_object"}
+    if cache_key:
+        extra["extra_body"] = {"prompt_cache_key": cache_key}
+
+    async with _llm_semaphore():  # at most LLM_CONCURRENCY requests in flight
+        res = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            **extra,
+        )
+    choice = res.choices[0]
+    text = choice.message.content
+    if text is None:  # e.g. a refusal: nothing worth caching
+        return ""
+    # A truncated answer ("length") or one the caller can't use must not
+    # be served from the cache for the next week
+    if choice.finish_reason == "stop" and (accept is None or accept(text)):
+        _cache_put(key, text)
+    return text
+
+
+async def llm_fan_out(
+    provider: str, prompts: List[str], system: Optional[str] = None, cache_key: Optional[str] = None
+) -> List[str]:
+    """
+    Run all prompts concurrently and return the outputs in prompt order.
+    `llm_call_async` keeps the process-wide LLM_CONCURRENCY bound.
+    """
+    return list(await asyncio.gather(
+        *(llm_call_async(provider, pr, system, cache_key) for pr in prompts)
+    ))
+
+
 # ---------- Prompt builders ----------
-def prompt_google_headlines(title: str, brand: str, category: str, price: Optional[float]) -> str:
-    """Prompt template for Google Ads headline generation."""
-    return textwrap.dedent(f"""
+# Each prompt = static instruction block (identical on every call) + a short
+# per-product "Input:" tail. Keeping all variable fields at the end gives a
+# byte-identical prefix across calls, which is what provider-side prompt
+# caching (e.g. OpenAI's automatic prefix cache) keys on. The static block is
+# sent as the system message, the tail as the user message.
+_ROLE = "You are a marketing copywriter."
+
+SYSTEM_PROMPT_GOOGLE = _ROLE + "\n" + textwrap.dedent("""
     Task: Create 5 Google Ads headlines (<= 30 chars each) for an e-commerce product.
     Rules:
     - Clear benefit + buying intent
     - Include brand if useful
-    - Use language relevant to {category or 'general'} shoppers
+    - Use language relevant to shoppers of the product's category (see Input)
     - If price exists, you may include a price hook — but avoid currency symbols unless useful
 
-    Input:
-      Title: {title}
-      Brand: {brand or 'N/A'}
-      Category: {category or 'N/A'}
-      Price: {price if price is not None else 'N/A'}
-
     Output format:
     1) ...
     2) ...
@@ -71,10 +255,7 @@ def prompt_google_headlines(title: str, brand: str, category: str, price: Option
     5) ...
     """)
 
-
-def prompt_instagram_caption(title: str, desc_html: str, brand: str) -> str:
-    """Prompt for Instagram caption writing with a casual marketing tone."""
-    return textwrap.dedent(f"""
+SYSTEM_PROMPT_INSTAGRAM = _ROLE + "\n" + textwrap.dedent("""
     Task: Write an Instagram caption (~120 words max) for a product.
     Rules:
     - Friendly, energetic tone
@@ -82,11 +263,6 @@ def prompt_instagram_caption(title: str, desc_html: str, brand: str) -> str:
     - 3 short benefit bullets
     - End with 4–6 relevant hashtags (not spammy)
 
-    Input:
-      Title: {title}
-      Brand: {brand or 'N/A'}
-      Description (HTML): {desc_html[:800]}
-
     Output format:
     Hook line
     • Benefit 1
@@ -95,13 +271,9 @@ def prompt_instagram_caption(title: str, desc_html: str, brand: str) -> str:
     Hashtags: #...
     """)
 
-
-def prompt_weekly_blog_outline(categories: List[str]) -> str:
-    """Prompt for generating a content calendar outline."""
-    cats = ", ".join(sorted({c for c in categories if c}))
-    return textwrap.dedent(f"""
-    Task: Create a weekly blog outline (5 sections) for an e-commerce store.
-    Theme categories: {cats or 'General Fitness'}
+SYSTEM_PROMPT_BLOG = _ROLE + "\n" + textwrap.dedent("""
+    Task: Create a weekly blog outline (5 sections) for an e-commerce store,
+    themed around the categories given in Input.
 
     Each section must have:
     - A title
@@ -116,10 +288,312 @@ def prompt_weekly_blog_outline(categories: List[str]) -> str:
     2) ...
     """)
 
+SYSTEM_PROMPT_VIDEO = _ROLE + "\n" + textwrap.dedent("""
+    Task: Create a 20–30 second script for TikTok/YouTube Shorts.
+    Style: quick cuts, upbeat voice-over, on-screen text for key claims
+    Rules:
+    - Hook in the first 3 seconds
+    - 2–3 benefit beats based on the key points
+    - End with a clear call-to-action
+
+    Output format:
+    HOOK: ...
+    SCENE 1: ...
+    SCENE 2: ...
+    SCENE 3: ...
+    CTA: ...
+    """)
+
+
+# Full per-call templates: dedented once at import, filled with format_map.
+# The variable fields only appear in the "Input:" tail after the static block.
+_GOOGLE_TPL = SYSTEM_PROMPT_GOOGLE + textwrap.dedent("""
+    Input:
+      Title: {title}
+      Brand: {brand}
+      Category: {category}
+      Price: {price}
+    """)
+
+_INSTAGRAM_TPL = SYSTEM_PROMPT_INSTAGRAM + textwrap.dedent("""
+    Input:
+      Title: {title}
+      Brand: {brand}
+      Description (HTML): {description}
+    """)
+
+_BLOG_TPL = SYSTEM_PROMPT_BLOG + textwrap.dedent("""
+    Input:
+      Theme categories: {categories}
+    """)
+
+_VIDEO_TPL = SYSTEM_PROMPT_VIDEO + textwrap.dedent("""
+    Input:
+      Product: {title}
+      Category: {category}
+      Key points:
+    {bullets}
+    """)
+
+# Per-product builders are memoized on their (hashable) arguments, so
+# products sharing the same fields reuse the rendered text.
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def prompt_google_headlines(title: str, brand: str, category: str, price: Optional[float]) -> str:
+    """Prompt template for Google Ads headline generation."""
+    return _GOOGLE_TPL.format_map({
+        "title": title,
+        "brand": brand or "N/A",
+        "category": category or "N/A",
+        "price": price if price is not None else "N/A",
+    })
+
+
+SYSTEM_PROMPT_GOOGLE_BATCH = _ROLE + "\n" + textwrap.dedent("""
+    Task: Create 5 Google Ads headlines (<= 30 chars each) for EACH e-commerce product in Input.
+    Rules:
+    - Clear benefit + buying intent
+    - Include brand if useful
+    - Use language relevant to shoppers of each product's category
+    - If price exists, you may include a price hook — but avoid currency symbols unless useful
+
+    Output format: only a JSON object with one entry per product, in Input order:
+    {"products": [{"id": "<product id>", "headlines": ["...", "...", "...", "...", "..."]}, ...]}
+    """)
+
+
+def prompt_google_headlines_batch(items: List[Dict]) -> str:
+    """Prompt for Google Ads headlines for several products in one request."""
+    products = [
+        {
+            "id": it["id"],
+            "title": it["title"],
+            "brand": it["brand"] or "N/A",
+            "category": it["category"] or "N/A",
+            "price": it["price"] if it["price"] is not None else "N/A",
+        }
+        for it in items
+    ]
+    return SYSTEM_PROMPT_GOOGLE_BATCH + "\nInput:\nProducts:\n" + json.dumps(products, ensure_ascii=False) + "\n"
 
-def prompt_short_video_script(title: str, category: str, key_points: List[str]) -> str:
+
+def parse_headlines_batch(text: str, ids: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Parse a batched headline answer into {product_id: "1) ...\\n2) ..."}.
+    Tolerates a ```json fence around the answer and a bare array instead of
+    {"products": [...]}. Returns None if the answer is not the expected JSON
+    or misses a product.
+    """
+    try:
+        data = json.loads(_JSON_FENCE_RE.sub("", text or ""))
+        if isinstance(data, dict):
+            data = data["products"]
+        out = {
+            str(obj["id"]): "\n".join(f"{i}) {h}" for i, h in enumerate(obj["headlines"], 1))
+            for obj in data
+        }
+    except (ValueError, TypeError, KeyError):
+        return None
+    return out if all(pid in out for pid in ids) else None
+
+
+def prompt_instagram_caption(title: str, desc_html: str, brand: str) -> str:
+    """
+    Prompt for Instagram caption writing with a casual marketing tone.
+    `desc_html` is expected to be pre-truncated (iter_products reads 800 chars).
+    """
+    return _INSTAGRAM_TPL.format_map({
+        "title": title,
+        "brand": brand or "N/A",
+        "description": desc_html,
+    })
+
+
+def prompt_weekly_blog_outline(categories: Iterable[Optional[str]]) -> str:
+    """
+    Prompt for generating a content calendar outline. `categories` is used
+    in the order given (fetch_all_categories is already distinct and sorted);
+    only None/empty entries are dropped.
+    """
+    return _outline_prompt(tuple(c for c in categories if c))
+
+
+@lru_cache(maxsize=1)
+def _outline_prompt(cats: Tuple[str, ...]) -> str:
+    """The outline prompt only depends on the category tuple."""
+    return _BLOG_TPL.format_map({"categories": ", ".join(cats) or "General Fitness"})
+
+
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def prompt_short_video_script(title: str, category: str, key_points: Tuple[str, ...]) -> str:
     """Prompt to generate a 20–30s TikTok/Shorts script."""
-    bullets = "\n".join([f"- {p}" for p in key_points[:4]])
-    return textwrap.dedent(f"""
-    Task: Create a 20–30 second script for TikTok/YouTube Shorts.
-    Style: quick cuts, up
+    return _VIDEO_TPL.format_map({
+        "title": title,
+        "category": category or "N/A",
+        "bullets": "\n".join([f"  - {p}" for p in key_points[:4]]),
+    })
+
+
+# ---------- Data access ----------
+# Fixed SQL text: sqlite3 keeps prepared statements in a per-connection cache
+# keyed by the SQL string, so reusing one connection also reuses the plans.
+_PRODUCTS_SQL = """
+    SELECT id, title, brand, category, price,
+           substr(description, 1, 800) AS description  -- only a prefix goes into prompts
+    FROM products
+    WHERE title IS NOT NULL AND title <> ''
+    LIMIT ?
+"""
+# GROUP BY walks ix_products_category in order instead of hashing a full scan
+_CATEGORIES_SQL = "SELECT category FROM products WHERE category IS NOT NULL GROUP BY category LIMIT ?"
+
+
+def ensure_indexes(con: sqlite3.Connection) -> None:
+    """
+    Indexes behind the fetchers' queries. FeedWizard's ProductORM declares the
+    same ones; this covers DBs created before they were added.
+    """
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_products_title_present ON products(id) "
+        "WHERE title IS NOT NULL AND title <> ''"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS ix_products_category ON products(category)")
+    con.commit()
+
+
+@lru_cache(maxsize=1)
+def _db() -> sqlite3.Connection:
+    """One shared connection to the FeedWizard DB, opened on first use."""
+    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.row_factory = sqlite3.Row
+    ensure_indexes(con)
+    return con
+
+
+def iter_products(limit: int = 5) -> Iterator[sqlite3.Row]:
+    """
+    Stream products with a usable title from the FeedWizard DB.
+    Rows come straight off the cursor (sqlite3.Row supports p["title"]),
+    so no list or per-row dict is built up front.
+    """
+    yield from _db().execute(_PRODUCTS_SQL, (limit,))
+
+
+@lru_cache(maxsize=1)
+def fetch_all_categories(limit: int = 1000) -> Tuple[str, ...]:
+    """
+    Distinct product categories (used for the blog outline). Cached for the
+    process lifetime; a tuple, so it can feed other lru_cached helpers.
+    """
+    return tuple(r[0] for r in _db().execute(_CATEGORIES_SQL, (limit,)))
+
+
+def _chunks(items: Iterable, n: int) -> Iterator[List]:
+    """Consecutive lists of at most `n` items, consuming `items` lazily."""
+    it = iter(items)
+    while chunk := list(islice(it, n)):
+        yield chunk
+
+
+# ---------- Runners ----------
+# Each runner builds all of its prompts first and sends them concurrently,
+# so wall time is roughly one LLM latency instead of one per product.
+async def generate_google_ads_samples(n: int = 3) -> List[Tuple[str, str]]:
+    """
+    Google Ads headlines for the first `n` products → [(product_id, output)].
+
+    Products are sent LLM_BATCH_SIZE at a time in one JSON-mode prompt that
+    asks for {"products": [{"id": ..., "headlines": [...]}, ...]}; a batch
+    whose answer does not parse falls back to one prompt per product.
+    """
+    batches = list(_chunks(iter_products(n), LLM_BATCH_SIZE))
+    batch_ids = [[p["id"] for p in batch] for batch in batches]
+    answers = await asyncio.gather(*(
+        llm_call_async(
+            "openai", prompt_google_headlines_batch(batch),
+            SYSTEM_PROMPT_GOOGLE_BATCH, "google_ads_batch_v1", 150 * len(batch),
+            json_mode=True,
+            # only answers that parse for the whole batch are cached
+            accept=lambda text, ids=ids: parse_headlines_batch(text, ids) is not None,
+        )
+        for batch, ids in zip(batches, batch_ids)
+    ))
+
+    results: Dict[str, str] = {}
+    retry = []
+    for batch, ids, text in zip(batches, batch_ids, answers):
+        parsed = parse_headlines_batch(text, ids)
+        if parsed is None:
+            retry.extend(batch)
+        else:
+            results.update(parsed)
+
+    prompts = [
+        prompt_google_headlines(p["title"], p["brand"], p["category"], p["price"])
+        for p in retry
+    ]
+    outputs = await llm_fan_out("openai", prompts, SYSTEM_PROMPT_GOOGLE, "google_ads_v1")
+    results.update((p["id"], text) for p, text in zip(retry, outputs))
+    return [(p["id"], results[p["id"]]) for batch in batches for p in batch]
+
+
+async def generate_instagram_captions(n: int = 2) -> List[Tuple[str, str]]:
+    """Instagram captions for the first `n` products → [(product_id, output)]."""
+    ids, prompts = [], []
+    for p in iter_products(n):
+        ids.append(p["id"])
+        prompts.append(prompt_instagram_caption(p["title"], p["description"] or "", p["brand"]))
+    outputs = await llm_fan_out("openai", prompts, SYSTEM_PROMPT_INSTAGRAM, "instagram_v1")
+    return list(zip(ids, outputs))
+
+
+async def generate_weekly_blog_outline() -> str:
+    """One weekly blog outline built from the store's category list."""
+    prompt = prompt_weekly_blog_outline(fetch_all_categories())
+    return await llm_call_async("openai", prompt, SYSTEM_PROMPT_BLOG, "blog_outline_v1")
+
+
+async def generate_short_video_scripts(n: int = 2) -> List[Tuple[str, str]]:
+    """Short-form video scripts for the first `n` products → [(product_id, output)]."""
+    ids, prompts = [], []
+    for p in iter_products(n):
+        keys = (
+            f"Brand: {p['brand']}" if p["brand"] else "Trusted quality",
+            f"Price: {p['price']} SEK" if p["price"] is not None else "Great value",
+            f"Made for {p['category']}" if p["category"] else "Built for everyday training",
+        )
+        ids.append(p["id"])
+        prompts.append(prompt_short_video_script(p["title"], p["category"], keys))
+    outputs = await llm_fan_out("openai", prompts, SYSTEM_PROMPT_VIDEO, "short_video_v1")
+    return list(zip(ids, outputs))
+
+
+async def main():
+    # The four sections are independent, so their LLM waits overlap;
+    # output is printed afterwards in the usual order
+    ads, captions, outline, scripts = await asyncio.gather(
+        generate_google_ads_samples(3),
+        generate_instagram_captions(2),
+        generate_weekly_blog_outline(),
+        generate_short_video_scripts(2),
+    )
+
+    print("=== Google Ads headlines ===")
+    for pid, text in ads:
+        print(f"[{pid}] {text}\n")
+
+    print("=== Instagram captions ===")
+    for pid, text in captions:
+        print(f"[{pid}] {text}\n")
+
+    print("=== Weekly blog outline ===")
+    print(outline, "\n")
+
+    print("=== Short video scripts ===")
+    for pid, text in scripts:
+        print(f"[{pid}] {text}\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,21 @@
 # models.py
 from __future__ import annotations
 import re
-from typing import Optional, List
+from typing import Any, Dict, Iterable, List, Optional
 
-from pydantic import BaseModel, HttpUrl, field_validator
+import polars as pl
+from pydantic import BaseModel, TypeAdapter, field_validator
 
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Float
+from sqlalchemy import Float, Index, String, text
+
+# URL check shared by ProductModel and the column-wise path (Python + Polars regex)
+_HTTP_URL_PATTERN = r"(?i)^https?://"
+_HTTP_URL = re.compile(_HTTP_URL_PATTERN)
+_NON_DIGIT = re.compile(r"\D")
+
+# GTIN lengths commonly used in retail (EAN-8, UPC-A, EAN-13, GTIN-14)
+_VALID_GTIN_LENS = frozenset((8, 12, 13, 14))
 
 
 # ---------- SQLAlchemy Base ----------
@@ -35,9 +44,18 @@ class ProductORM(Base):
     brand: Mapped[Optional[str]] = mapped_column(String)
     image_url: Mapped[Optional[str]] = mapped_column(String)
     product_url: Mapped[Optional[str]] = mapped_column(String)
-    category: Mapped[Optional[str]] = mapped_column(String)
+    # Indexed for category listings (e.g. the marketing content generator)
+    category: Mapped[Optional[str]] = mapped_column(String, index=True)
     availability: Mapped[Optional[str]] = mapped_column(String)
 
+    # Partial index matching the marketing generator's "has a title" filter
+    __table_args__ = (
+        Index(
+            "idx_products_title_present", "id",
+            sqlite_where=text("title IS NOT NULL AND title <> ''"),
+        ),
+    )
+
 
 class IssueORM(Base):
     """
@@ -65,8 +83,10 @@ class ProductModel(BaseModel):
     gtin: Optional[str] = None
     brand: Optional[str] = None
 
-    image_url: Optional[HttpUrl] = None
-    product_url: Optional[HttpUrl] = None
+    # Plain strings: URLs are only stored, so a cheap scheme check replaces
+    # HttpUrl's full parse (host/port/IDNA) on every row
+    image_url: Optional[str] = None
+    product_url: Optional[str] = None
 
     category: Optional[str] = None
     availability: Optional[str] = None
@@ -97,19 +117,67 @@ class ProductModel(BaseModel):
         """
         if not v:
             return None
-        digits = re.sub(r"\D", "", str(v))
-        if len(digits) in (8, 12, 13, 14):
+        s = v if isinstance(v, str) else str(v)
+        # Fast path: a clean feed value needs no regex pass
+        # (isdecimal matches exactly the characters \d keeps)
+        if s.isdecimal() and len(s) in _VALID_GTIN_LENS:
+            return s
+        digits = _NON_DIGIT.sub("", s)
+        if len(digits) in _VALID_GTIN_LENS:
             return digits
         return None
 
     @field_validator("image_url", "product_url", mode="before")
     @classmethod
-    def empty_url_to_none(cls, v):
+    def check_url(cls, v):
         """
-        Treat empty string URLs as None so Pydantic HttpUrl validator won't fail.
+        Treat empty string URLs as None; anything else must be an http(s) URL.
         """
         s = (str(v).strip() if v is not None else "")
-        return s or None
+        if not s:
+            return None
+        if not _HTTP_URL.match(s):
+            raise ValueError("URL must start with http:// or https://")
+        return s
+
+
+# ---------- Bulk validation ----------
+# One pydantic-core call for a whole list instead of one __init__ per row
+PRODUCT_LIST_ADAPTER = TypeAdapter(List[ProductModel])
+
+
+def validate_many(rows: Iterable[Dict[str, Any]]) -> List[ProductModel]:
+    """Validate many raw rows at once; one ValidationError lists every bad row."""
+    return PRODUCT_LIST_ADAPTER.validate_python(list(rows))
+
+
+# ---------- Column-wise normalization (SoA fast path) ----------
+_URL_COLUMNS = ("image_url", "product_url")
+
+
+def normalize_products(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Apply ProductModel's normalization to a whole feed DataFrame at once,
+    so rows never have to be turned into Pydantic objects.
+
+    Rows with a non-http(s) URL are passed through ProductModel so they fail
+    with the usual ValidationError.
+    """
+    digits = pl.col("gtin").str.replace_all(r"\D", "")
+    df = df.with_columns(
+        pl.when(digits.str.len_chars().is_in(sorted(_VALID_GTIN_LENS))).then(digits).alias("gtin"),
+        pl.col("price").cast(pl.Float64, strict=False),
+        *[
+            pl.when(pl.col(c).str.strip_chars() != "").then(pl.col(c).str.strip_chars()).alias(c)
+            for c in _URL_COLUMNS
+        ],
+    )
+
+    invalid = pl.any_horizontal(
+        pl.col(c).is_not_null() & ~pl.col(c).str.contains(_HTTP_URL_PATTERN) for c in _URL_COLUMNS
+    )
+    validate_many(df.filter(invalid).iter_rows(named=True))  # raises ValidationError
+    return df
 
 
 # ---------- Business Validation Logic ----------
@@ -123,7 +191,7 @@ def validate_product(p: ProductModel) -> List[str]:
     if p.price is None or p.price <= 0:
         issues.append("missing_or_invalid_price")
 
-    if not p.gtin or len(p.gtin) not in (8, 12, 13, 14):
+    if not p.gtin or len(p.gtin) not in _VALID_GTIN_LENS:
         issues.append("missing_or_invalid_gtin")
 
     if not p.image_url:
@@ -133,3 +201,30 @@ def validate_product(p: ProductModel) -> List[str]:
         issues.append("weak_title")
 
     return issues
+
+
+def find_issues(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Column-wise version of `validate_product` for a whole feed DataFrame.
+    Applies the same rules (incl. the GTIN digit cleanup done by ProductModel)
+    in one vectorized pass and returns one (id, issue) row per detected issue.
+    """
+    gtin_len = pl.col("gtin").str.replace_all(r"\D", "").str.len_chars()
+    title_len = pl.col("title").str.strip_chars().str.len_chars()
+
+    flags = df.select(
+        pl.col("id").fill_null(""),
+        (pl.col("price").is_null() | (pl.col("price") <= 0))
+        .alias("missing_or_invalid_price"),
+        (~gtin_len.is_in(sorted(_VALID_GTIN_LENS))).fill_null(True)
+        .alias("missing_or_invalid_gtin"),
+        (pl.col("image_url").str.strip_chars().fill_null("") == "")
+        .alias("missing_image_url"),
+        (title_len < 4).fill_null(True)
+        .alias("weak_title"),
+    )
+    return (
+        flags.unpivot(index="id", variable_name="issue")
+        .filter(pl.col("value"))
+        .select("id", "issue")
+    )